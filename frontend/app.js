@@ -6,8 +6,10 @@
 class BuscadorEstablecimientos {
     constructor() {
         this.apiBaseUrl = 'https://maquinastabaco.onrender.com';
-        this.currentSkip = 0;
+        this.currentCursor = null;
         this.currentLimit = 25;
+        this.totalResults = 0;
+        this.shownResults = 0;
         this.currentSearch = '';
         this.currentProvincia = '';
         this.isLoading = false;
@@ -119,7 +121,7 @@ class BuscadorEstablecimientos {
     }
 
     resetPagination() {
-        this.currentSkip = 0;
+        this.currentCursor = null;
         this.hasMoreResults = false;
         this.btnCargarMas.style.display = 'none';
     }
@@ -132,10 +134,13 @@ class BuscadorEstablecimientos {
 
         try {
             const params = new URLSearchParams({
-                skip: this.currentSkip.toString(),
                 limit: this.currentLimit.toString()
             });
 
+            if (append && this.currentCursor) {
+                params.append('cursor', this.currentCursor);
+            }
+
             if (this.currentSearch) {
                 params.append('search', this.currentSearch);
             }
@@ -167,6 +172,9 @@ class BuscadorEstablecimientos {
 
         if (!append) {
             this.listaResultados.innerHTML = '';
+            // La API solo devuelve el total en la primera página
+            this.totalResults = pagination.total;
+            this.shownResults = 0;
         }
 
         if (establecimientos.length === 0 && !append) {
@@ -180,14 +188,15 @@ class BuscadorEstablecimientos {
         });
 
         // Actualizar metadatos
-        this.updateResultsMetadata(pagination);
+        this.shownResults += pagination.returned;
+        this.updateResultsMetadata();
 
         // Mostrar/ocultar botón "Cargar más"
         this.hasMoreResults = pagination.has_more;
         this.btnCargarMas.style.display = this.hasMoreResults ? 'block' : 'none';
 
-        // Actualizar skip para próxima carga
-        this.currentSkip = pagination.next_skip || this.currentSkip + this.currentLimit;
+        // Guardar cursor para próxima carga
+        this.currentCursor = pagination.next_cursor;
     }
 
     renderEstablecimiento(establecimiento) {
@@ -216,10 +225,8 @@ class BuscadorEstablecimientos {
         }, 50);
     }
 
-    updateResultsMetadata(pagination) {
-        const total = pagination.total;
-        const returned = pagination.returned;
-        const skip = pagination.skip;
+    updateResultsMetadata() {
+        const total = this.totalResults;
 
         // Actualizar título
         if (this.currentSearch || this.currentProvincia) {
@@ -238,8 +245,7 @@ class BuscadorEstablecimientos {
 
         // Actualizar contador
         if (total > 0) {
-            const showing = skip + returned;
-            this.resultsCount.textContent = `Mostrando ${showing} de ${total}`;
+            this.resultsCount.textContent = `Mostrando ${this.shownResults} de ${total}`;
             this.resultsCount.style.display = 'block';
         } else {
             this.resultsCount.style.display = 'none';
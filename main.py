@@ -5,79 +5,382 @@ Proporciona endpoints para buscar máquinas de tabaco.
 """
 
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from fastapi import FastAPI, Query, HTTPException
+import re
+import base64
+import asyncio
+import hashlib
+import secrets
+import itertools
+import asyncpg
+import orjson
+import redis.asyncio as aioredis
+from cachetools import TTLCache
+from fastapi import FastAPI, Query, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from typing import Optional, List, Dict, Any
 
+# Longitud mínima del término para usar la búsqueda de texto completo por prefijos;
+# los términos más cortos (que pg_trgm no puede indexar y que suelen ser stopwords)
+# se buscan con ILIKE sobre las mismas columnas
+MIN_FULLTEXT_SEARCH_LENGTH = 3
+
+# Caché en memoria de la lista de provincias: solo cambia al ejecutar load_data.py.
+# Guarda (versión de caché, provincias) para que todos los workers la invaliden
+# cuando cambia la versión compartida en Redis
+_provincias_cache = TTLCache(maxsize=1, ttl=3600)
+
+# Caché Redis (opcional) de las páginas de /api/establecimientos
+ESTABLECIMIENTOS_CACHE_TTL = 60
+# Se incrementa tras cada carga de datos para invalidar todas las claves est:v{N}:*
+ESTABLECIMIENTOS_CACHE_VERSION_KEY = "est:version"
+
+# Caché en memoria de resultados por (consulta, parámetros) de muy corta duración;
+# absorbe ráfagas de peticiones idénticas (p. ej. re-renderizados del frontend)
+FETCH_CACHE_TTL = 5
+_fetch_cache = TTLCache(maxsize=1024, ttl=FETCH_CACHE_TTL)
+# Consultas en curso: las peticiones idénticas esperan al mismo resultado
+_fetch_inflight: Dict[bytes, asyncio.Future] = {}
+
 # Cargar variables de entorno
 load_dotenv()
 
+# Configuración resuelta una sola vez al importar, fuera de las rutas de cada petición
+DATABASE_URL = os.getenv('DATABASE_URL')
+if not DATABASE_URL:
+    raise RuntimeError("DATABASE_URL no configurada")
+
+# Detrás de PgBouncer en modo transaction no se pueden reutilizar
+# sentencias preparadas entre transacciones: usar DB_STATEMENT_CACHE_SIZE=0
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+
+REDIS_URL = os.getenv('REDIS_URL')
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Orígenes permitidos separados por comas; sin configurar se admite cualquier
+# origen pero sin credenciales (el frontend no usa cookies)
+CORS_ORIGINS = [origin.strip() for origin in os.getenv('CORS_ORIGINS', '').split(',') if origin.strip()]
+
 # Crear aplicación FastAPI
 app = FastAPI(
     title="Buscador de Establecimientos España",
     description="API para buscar máquinas de tabaco en España",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# Configurar CORS para permitir peticiones desde cualquier origen
+# Configurar CORS: lista explícita de orígenes si CORS_ORIGINS está definida
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
+    allow_origins=CORS_ORIGINS or ["*"],
+    allow_credentials=bool(CORS_ORIGINS),
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
 )
 
-def get_database_connection():
-    """Obtiene una conexión a la base de datos PostgreSQL"""
-    database_url = os.getenv('DATABASE_URL')
-    if not database_url:
-        raise HTTPException(status_code=500, detail="DATABASE_URL no configurada")
+@app.on_event("startup")
+async def startup():
+    """Crea el pool de conexiones a PostgreSQL al arrancar la aplicación"""
+    app.state.pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=5,
+        max_size=20,
+        command_timeout=10,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE
+    )
+    
+    app.state.provincias_lock = asyncio.Lock()
+    _provincias_cache.clear()
+    
+    app.state.redis = aioredis.from_url(REDIS_URL) if REDIS_URL else None
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Cierra el pool de conexiones al detener la aplicación"""
+    await app.state.pool.close()
+    if app.state.redis is not None:
+        await app.state.redis.close()
+
+async def get_cache_version() -> Optional[int]:
+    """
+    Obtiene la versión de caché compartida en Redis, que load_data.py y /refresh incrementan.
+    
+    Returns:
+        int: versión actual, o None si Redis no está configurado o no responde
+    """
+    if app.state.redis is None:
+        return None
     
     try:
-        conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-        return conn
-    except psycopg2.Error as e:
-        raise HTTPException(status_code=500, detail=f"Error de conexión a la base de datos: {str(e)}")
+        version = await app.state.redis.get(ESTABLECIMIENTOS_CACHE_VERSION_KEY)
+    except aioredis.RedisError:
+        return None
+    
+    return int(version or 0)
 
-def build_search_query(search: Optional[str], provincia: Optional[str], skip: int, limit: int) -> tuple:
+async def get_cached_response(version: Optional[int], search: Optional[str], provincia: Optional[str], cursor: Optional[str], limit: int) -> tuple:
     """
-    Construye la consulta SQL dinámica y segura para buscar establecimientos.
+    Busca en Redis una respuesta cacheada de /api/establecimientos.
+    Los errores de Redis no interrumpen la petición: se trata como un fallo de caché.
     
     Returns:
-        tuple: (query_string, query_params)
+        tuple: (cache_key, respuesta) — ambos None si Redis no está disponible
     """
-    base_query = """
-    SELECT id, nombre, direccion, localidad, provincia
-    FROM establecimientos
-    WHERE 1=1
+    if app.state.redis is None or version is None:
+        return None, None
+    
+    cache_key = f"est:v{version}:{search}|{provincia}|{cursor}|{limit}"
+    try:
+        cached = await app.state.redis.get(cache_key)
+    except aioredis.RedisError:
+        return None, None
+    
+    return cache_key, orjson.loads(cached) if cached is not None else None
+
+async def set_cached_response(cache_key: Optional[str], response: Dict[str, Any]):
+    """Guarda en Redis una respuesta de /api/establecimientos"""
+    if app.state.redis is None or cache_key is None:
+        return
+    
+    try:
+        await app.state.redis.set(cache_key, orjson.dumps(response), ex=ESTABLECIMIENTOS_CACHE_TTL)
+    except aioredis.RedisError:
+        pass
+
+def encode_cursor(nombre: str, establecimiento_id: int) -> str:
+    """Codifica la posición (nombre, id) del último resultado como cursor opaco"""
+    return base64.urlsafe_b64encode(orjson.dumps([nombre, establecimiento_id])).decode('ascii')
+
+def decode_cursor(cursor: str) -> tuple:
     """
+    Decodifica un cursor generado por encode_cursor.
     
-    params = []
+    Returns:
+        tuple: (nombre, id) del último resultado de la página anterior
+    """
+    try:
+        nombre, establecimiento_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+    
+    # Valores que PostgreSQL no aceptaría como (text, int4): un NUL en el nombre,
+    # ids fuera del rango de SERIAL o bool, que es subclase de int
+    if (
+        not isinstance(nombre, str)
+        or '\x00' in nombre
+        or not isinstance(establecimiento_id, int)
+        or isinstance(establecimiento_id, bool)
+        or not 1 <= establecimiento_id <= 2**31 - 1
+    ):
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+    
+    return nombre, establecimiento_id
+
+async def cached_fetch(query: str, params: list, version: Optional[int] = None) -> list:
+    """
+    Ejecuta una consulta con caché TTL y deduplicación de consultas simultáneas.
+    Si ya hay una consulta idéntica en curso, espera su resultado en lugar de
+    lanzar otra; solo se adquiere conexión del pool cuando hay que ir a la base de datos.
+    La versión de caché forma parte de la clave para que una nueva carga de datos
+    no sirva resultados anteriores.
+    """
+    key = hashlib.blake2b(
+        query.encode() + repr(params).encode() + repr(version).encode(),
+        digest_size=16
+    ).digest()
+    
+    while True:
+        results = _fetch_cache.get(key)
+        if results is not None:
+            return results
+        
+        inflight = _fetch_inflight.get(key)
+        if inflight is None:
+            break
+        
+        try:
+            return await asyncio.shield(inflight)
+        except asyncio.CancelledError:
+            # Si la cancelada es esta petición, propagar; si se canceló la
+            # petición que lanzó la consulta, reintentar en lugar de heredarlo
+            if not inflight.cancelled():
+                raise
+    
+    future = asyncio.get_running_loop().create_future()
+    _fetch_inflight[key] = future
+    try:
+        async with app.state.pool.acquire() as conn:
+            results = await conn.fetch(query, *params)
+    except Exception as e:
+        future.set_exception(e)
+        # Marca la excepción como recuperada aunque no haya otras peticiones esperando
+        future.exception()
+        raise
+    except BaseException:
+        future.cancel()
+        raise
+    else:
+        _fetch_cache[key] = results
+        future.set_result(results)
+    finally:
+        del _fetch_inflight[key]
+    
+    return results
+
+def _build_conditions(search_mode: Optional[str], provincia_mode: Optional[str], has_cursor: bool) -> tuple:
+    """
+    Genera la cláusula WHERE para una combinación de filtros presentes.
+    
+    Args:
+        search_mode: None, 'fulltext' (palabras y prefijo), 'prefix' (solo prefijo) sobre search_tsv
+            o 'ilike' (nombre, localidad, provincia)
+        provincia_mode: None, 'exact' (provincia_lower) o 'ilike' (patrón con comodines)
+        has_cursor: Si se continúa después de un cursor (nombre, id)
+    
+    Returns:
+        tuple: (where_sql, siguiente número de parámetro)
+    """
+    conditions = []
     param_count = 1
     
-    # Agregar filtro de búsqueda por texto (solo en localidad)
-    if search and search.strip():
-        base_query += f" AND localidad ILIKE %s"
-        search_param = f"%{search.strip()}%"
-        params.append(search_param)
+    if search_mode == 'fulltext':
+        # Palabras completas contra los lexemas en español y la última (aún
+        # incompleta) como prefijo contra los lexemas sin stemming; && descarta
+        # la mitad vacía (p. ej. si las palabras completas son stopwords)
+        conditions.append(
+            f"search_tsv @@ (to_tsquery('spanish', ${param_count}) && to_tsquery('simple', ${param_count + 1}))"
+        )
+        param_count += 2
+    elif search_mode == 'prefix':
+        conditions.append(f"search_tsv @@ to_tsquery('simple', ${param_count})")
+        param_count += 1
+    elif search_mode == 'ilike':
+        conditions.append(
+            f"(nombre ILIKE ${param_count} OR localidad ILIKE ${param_count} OR provincia ILIKE ${param_count})"
+        )
         param_count += 1
     
-    # Agregar filtro por provincia
-    if provincia and provincia.strip():
-        base_query += f" AND provincia ILIKE %s"
-        params.append(f"%{provincia.strip()}%")
+    if provincia_mode == 'exact':
+        conditions.append(f"provincia_lower = LOWER(${param_count})")
         param_count += 1
+    elif provincia_mode == 'ilike':
+        conditions.append(f"provincia ILIKE ${param_count}")
+        param_count += 1
+    
+    if has_cursor:
+        conditions.append(f"(nombre, id) > (${param_count}, ${param_count + 1})")
+        param_count += 2
+    
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return where, param_count
+
+def _build_search_query_template(search_mode: Optional[str], provincia_mode: Optional[str], has_cursor: bool) -> str:
+    """
+    Genera el SQL de una página de resultados para una combinación de filtros.
+    Solo se llama al importar el módulo para construir _SEARCH_QUERIES.
+    """
+    where, param_count = _build_conditions(search_mode, provincia_mode, has_cursor)
+    
+    return (
+        "SELECT id, nombre, direccion, localidad, provincia FROM establecimientos"
+        f"{where} ORDER BY nombre ASC, id ASC LIMIT ${param_count}"
+    )
+
+def _build_count_query_template(search_mode: Optional[str], provincia_mode: Optional[str]) -> str:
+    """
+    Genera el SQL que cuenta todos los resultados de una combinación de filtros.
+    Solo se llama al importar el módulo para construir _COUNT_QUERIES.
+    """
+    where, _ = _build_conditions(search_mode, provincia_mode, False)
+    
+    return f"SELECT COUNT(*) FROM establecimientos{where}"
+
+_SEARCH_MODES = (None, 'fulltext', 'prefix', 'ilike')
+_PROVINCIA_MODES = (None, 'exact', 'ilike')
+
+# Todas las formas posibles de las consultas de búsqueda, precalculadas al importar.
+# Cada combinación produce siempre el mismo texto SQL, de modo que asyncpg
+# reutiliza la sentencia preparada de su caché por conexión.
+_SEARCH_QUERIES = {
+    key: _build_search_query_template(*key)
+    for key in itertools.product(_SEARCH_MODES, _PROVINCIA_MODES, (False, True))
+}
+_COUNT_QUERIES = {
+    key: _build_count_query_template(*key)
+    for key in itertools.product(_SEARCH_MODES, _PROVINCIA_MODES)
+}
+
+def _search_filters(search: Optional[str], provincia: Optional[str]) -> tuple:
+    """
+    Normaliza los filtros de búsqueda.
+    
+    Returns:
+        tuple: (search_mode, provincia_mode, params)
+    """
+    params = []
+    search_mode = None
+    
+    # Filtro de búsqueda por texto: la última palabra se busca como prefijo
+    # ("madri" -> madri:*) para que la búsqueda mientras se escribe encuentre
+    # palabras incompletas. El prefijo no pasa por el stemmer español, que
+    # reduciría "madrid" a "madr" pero dejaría "madri" intacto.
+    # Solo se usan caracteres de palabra, así que la consulta de to_tsquery es siempre válida
+    if search and search.strip():
+        search_term = search.strip()
+        words = re.findall(r'\w+', search_term)
+        if len(search_term) >= MIN_FULLTEXT_SEARCH_LENGTH and words:
+            *complete_words, last_word = words
+            if complete_words:
+                search_mode = 'fulltext'
+                params.append(' & '.join(complete_words))
+            else:
+                search_mode = 'prefix'
+            params.append(f"{last_word}:*")
+        else:
+            search_mode = 'ilike'
+            params.append(f"%{search_term}%")
+    
+    # Filtro por provincia: igualdad sobre el índice btree de provincia_lower
+    # (nombres exactos del select del frontend); ILIKE solo si hay comodines
+    provincia_mode = None
+    if provincia and provincia.strip():
+        provincia_term = provincia.strip()
+        provincia_mode = 'ilike' if '%' in provincia_term else 'exact'
+        params.append(provincia_term)
+    
+    return search_mode, provincia_mode, params
+
+def build_search_query(search: Optional[str], provincia: Optional[str], after: Optional[tuple], limit: int) -> tuple:
+    """
+    Construye la consulta SQL dinámica y segura para buscar establecimientos.
+    La paginación es por keyset: `after` es la posición (nombre, id) del último
+    resultado de la página anterior, o None para la primera página.
+    Se pide una fila más que `limit` para saber si hay más resultados sin contarlos.
+    
+    Returns:
+        tuple: (query_string, query_params)
+    """
+    search_mode, provincia_mode, params = _search_filters(search, provincia)
     
-    # Agregar ordenamiento y paginación
-    base_query += " ORDER BY nombre ASC"
-    base_query += f" LIMIT %s OFFSET %s"
-    params.extend([limit, skip])
+    # Continuar después del último resultado de la página anterior
+    if after is not None:
+        params.extend(after)
     
-    return base_query, params
+    params.append(limit + 1)
+    
+    return _SEARCH_QUERIES[(search_mode, provincia_mode, after is not None)], params
+
+def build_count_query(search: Optional[str], provincia: Optional[str]) -> tuple:
+    """
+    Construye la consulta SQL que cuenta el total de resultados de una búsqueda.
+    
+    Returns:
+        tuple: (query_string, query_params)
+    """
+    search_mode, provincia_mode, params = _search_filters(search, provincia)
+    
+    return _COUNT_QUERIES[(search_mode, provincia_mode)], params
 
 @app.get("/")
 async def root():
@@ -93,74 +396,67 @@ async def root():
 
 @app.get("/api/establecimientos")
 async def get_establecimientos(
-    search: Optional[str] = Query(None, description="Búsqueda por localidad"),
-    provincia: Optional[str] = Query(None, description="Filtrar por provincia"),
-    skip: int = Query(0, ge=0, description="Número de resultados a omitir (paginación)"),
+    search: Optional[str] = Query(None, description="Búsqueda por nombre, localidad o provincia"),
+    provincia: Optional[str] = Query(None, description="Filtrar por provincia exacta (admite comodines '%')"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor por la página anterior"),
     limit: int = Query(25, ge=1, le=100, description="Número máximo de resultados a devolver")
 ):
     """
     Busca establecimientos con filtros opcionales y paginación.
     
     Args:
-        search: Texto para buscar en localidad (case-insensitive)
-        provincia: Provincia para filtrar (case-insensitive)
-        skip: Número de resultados a omitir para paginación
+        search: Texto para buscar en nombre, localidad y provincia (prefijos de palabra, texto completo en español)
+        provincia: Provincia exacta para filtrar (case-insensitive); admite comodines '%' con ILIKE
+        cursor: Cursor de paginación (next_cursor de la página anterior)
         limit: Número máximo de resultados a devolver (máximo 100)
     
     Returns:
         Dict con los resultados y metadatos de paginación
     """
-    conn = None
-    cursor = None
+    after = decode_cursor(cursor) if cursor else None
+    
+    version = await get_cache_version()
+    
+    cache_key, cached = await get_cached_response(version, search, provincia, cursor, limit)
+    if cached is not None:
+        return cached
     
     try:
-        # Conectar a la base de datos
-        conn = get_database_connection()
-        cursor = conn.cursor()
-        
         # Construir consulta
-        query, params = build_search_query(search, provincia, skip, limit)
-        
-        # Ejecutar consulta
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        
-        # Convertir resultados a lista de diccionarios
-        establecimientos = [dict(row) for row in results]
+        query, params = build_search_query(search, provincia, after, limit)
         
-        # Obtener el total de resultados (sin paginación) para metadatos
-        count_query = """
-        SELECT COUNT(*) as total
-        FROM establecimientos
-        WHERE 1=1
-        """
-        count_params = []
-        
-        if search and search.strip():
-            count_query += " AND localidad ILIKE %s"
-            search_param = f"%{search.strip()}%"
-            count_params.append(search_param)
+        # El total solo se calcula en la primera página: contar exige recorrer
+        # todas las coincidencias, justo lo que la paginación keyset evita.
+        # Página y total son independientes y usan cada uno su conexión del
+        # pool, así que se piden a la vez en lugar de en serie
+        total_count = None
+        if after is None:
+            count_query, count_params = build_count_query(search, provincia)
+            results, count_results = await asyncio.gather(
+                cached_fetch(query, params, version),
+                cached_fetch(count_query, count_params, version)
+            )
+            total_count = count_results[0][0]
+        else:
+            results = await cached_fetch(query, params, version)
         
-        if provincia and provincia.strip():
-            count_query += " AND provincia ILIKE %s"
-            count_params.append(f"%{provincia.strip()}%")
+        # La fila extra (limit + 1) solo indica que hay más resultados
+        has_more = len(results) > limit
+        establecimientos = [dict(row) for row in results[:limit]]
         
-        cursor.execute(count_query, count_params)
-        total_count = cursor.fetchone()['total']
+        next_cursor = None
+        if has_more:
+            last = establecimientos[-1]
+            next_cursor = encode_cursor(last['nombre'], last['id'])
         
-        # Calcular metadatos de paginación
-        has_more = (skip + len(establecimientos)) < total_count
-        next_skip = skip + limit if has_more else None
-        
-        return {
+        response = {
             "establecimientos": establecimientos,
             "pagination": {
                 "total": total_count,
-                "skip": skip,
                 "limit": limit,
                 "returned": len(establecimientos),
                 "has_more": has_more,
-                "next_skip": next_skip
+                "next_cursor": next_cursor
             },
             "filters": {
                 "search": search,
@@ -168,66 +464,93 @@ async def get_establecimientos(
             }
         }
         
-    except psycopg2.Error as e:
+        await set_cached_response(cache_key, response)
+        
+        return response
+        
+    except asyncpg.PostgresError as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta a la base de datos: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
-@app.get("/api/provincias")
-async def get_provincias():
-    """
-    Obtiene la lista de todas las provincias disponibles en la base de datos.
-    Útil para poblar el select de provincias en el frontend.
-    """
-    conn = None
-    cursor = None
-    
+async def fetch_provincias() -> List[str]:
+    """Consulta la lista de provincias distintas en la vista materializada provincias_mv"""
     try:
-        conn = get_database_connection()
-        cursor = conn.cursor()
-        
+        # Vista materializada creada y refrescada por scripts/load_data.py
         query = """
-        SELECT DISTINCT provincia
-        FROM establecimientos
-        WHERE provincia IS NOT NULL AND provincia != ''
+        SELECT provincia
+        FROM provincias_mv
         ORDER BY provincia ASC
         """
         
-        cursor.execute(query)
-        results = cursor.fetchall()
+        async with app.state.pool.acquire() as conn:
+            results = await conn.fetch(query)
         
-        provincias = [row['provincia'] for row in results]
-        
-        return {
-            "provincias": provincias,
-            "total": len(provincias)
-        }
+        # Acceso por posición: la consulta devuelve una sola columna
+        return [row[0] for row in results]
         
-    except psycopg2.Error as e:
+    except asyncpg.PostgresError as e:
         raise HTTPException(status_code=500, detail=f"Error en la consulta a la base de datos: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+
+@app.get("/api/provincias")
+async def get_provincias():
+    """
+    Obtiene la lista de todas las provincias disponibles en la base de datos.
+    Útil para poblar el select de provincias en el frontend.
+    El resultado se cachea en memoria durante una hora, o hasta que cambie
+    la versión de caché en Redis (ver /refresh).
+    """
+    version = await get_cache_version()
+    
+    cached = _provincias_cache.get("v")
+    if cached is None or cached[0] != version:
+        async with app.state.provincias_lock:
+            # Otra petición puede haber poblado la caché mientras esperábamos
+            cached = _provincias_cache.get("v")
+            if cached is None or cached[0] != version:
+                cached = (version, await fetch_provincias())
+                _provincias_cache["v"] = cached
+    
+    provincias = cached[1]
+    
+    return {
+        "provincias": provincias,
+        "total": len(provincias)
+    }
+
+@app.post("/refresh")
+async def refresh_cache(x_admin_token: Optional[str] = Header(None)):
+    """
+    Invalida las cachés de la API.
+    Debe llamarse después de volver a ejecutar scripts/load_data.py.
+    Requiere que ADMIN_TOKEN esté configurado y se envíe en la cabecera X-Admin-Token.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Endpoint deshabilitado: ADMIN_TOKEN no configurado")
+    
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Token de administración no válido")
+    
+    _provincias_cache.clear()
+    _fetch_cache.clear()
+    
+    if app.state.redis is not None:
+        try:
+            await app.state.redis.incr(ESTABLECIMIENTOS_CACHE_VERSION_KEY)
+        except aioredis.RedisError as e:
+            # Las cachés locales ya están limpias; Redis expirará sus claves por TTL
+            return {"status": "partial", "message": f"Cachés locales invalidadas; Redis no disponible: {str(e)}"}
+    
+    return {"status": "ok", "message": "Cachés invalidadas"}
 
 @app.get("/health")
 async def health_check():
     """Endpoint de salud para verificar que la API está funcionando"""
     try:
-        conn = get_database_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.fetchone()
-        cursor.close()
-        conn.close()
+        async with app.state.pool.acquire() as conn:
+            await conn.fetchval("SELECT 1")
         
         return {
             "status": "healthy",
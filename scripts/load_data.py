@@ -5,12 +5,31 @@ Este script se ejecuta una sola vez para migrar los datos.
 """
 
 import os
-import json
-import pandas as pd
+import struct
+import ijson
 import psycopg2
-from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
+# Claves que debe tener cada establecimiento del JSON
+REQUIRED_COLUMNS = ['nombre', 'direccion', 'localidad', 'provincia']
+
+# Tabla que consulta la API y tabla auxiliar en la que se prepara cada carga
+TABLE_NAME = 'establecimientos'
+STAGING_TABLE_NAME = 'establecimientos_staging'
+
+# Índices secundarios de la tabla: se construyen sobre la tabla auxiliar después
+# del COPY (con el sufijo _staging) y se renombran al intercambiar las tablas
+INDEXES = {
+    # Índice de cobertura para la paginación keyset por (nombre, id): permite index-only scans
+    "idx_est_nombre_cov": "(nombre, id) INCLUDE (direccion, localidad, provincia)",
+    # Filtro de provincia con comodines (ILIKE) de la API
+    "idx_est_provincia_trgm": "USING gin (provincia gin_trgm_ops)",
+    # Filtro exacto por provincia (provincia_lower = LOWER(...)) de la API
+    "idx_est_prov_lower": "(provincia_lower)",
+    # Búsqueda de texto completo por prefijos (to_tsquery) de la API
+    "idx_est_tsv": "USING gin (search_tsv)",
+}
+
 def load_environment():
     """Carga las variables de entorno desde el archivo .env"""
     load_dotenv()
@@ -19,104 +38,219 @@ def load_environment():
         raise ValueError("DATABASE_URL no está definida en el archivo .env")
     return database_url
 
-def create_table_if_not_exists(cursor):
-    """Crea la tabla establecimientos si no existe"""
-    create_table_query = """
-    CREATE TABLE IF NOT EXISTS establecimientos (
+def configure_bulk_load_transaction(cursor):
+    """
+    Ajusta la transacción de carga para priorizar velocidad.
+    Sin synchronous_commit no se espera al fsync del WAL; si el proceso falla
+    basta con volver a ejecutar el script, ya que la carga es idempotente.
+    """
+    cursor.execute("SET LOCAL synchronous_commit = off;")
+    
+    # Memoria para construir los índices (GIN/btree) tras el COPY. Valores por defecto
+    # prudentes para instancias gestionadas pequeñas (p. ej. Render); súbelos si el
+    # servidor tiene memoria de sobra
+    maintenance_work_mem = os.getenv('LOAD_MAINTENANCE_WORK_MEM', '128MB')
+    work_mem = os.getenv('LOAD_WORK_MEM', '16MB')
+    
+    # set_config(..., true) equivale a SET LOCAL y admite parámetros
+    cursor.execute("SELECT set_config('maintenance_work_mem', %s, true);", (maintenance_work_mem,))
+    cursor.execute("SELECT set_config('work_mem', %s, true);", (work_mem,))
+    print(f"✓ Transacción configurada para carga masiva (maintenance_work_mem={maintenance_work_mem}, work_mem={work_mem})")
+
+def create_table(cursor, table_name):
+    """Crea (vacía) la tabla de establecimientos con el nombre indicado"""
+    cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
+    
+    # search_tsv: columna generada para la búsqueda de texto completo de la API;
+    # une los lexemas en español (palabras completas) y sin stemming (prefijos)
+    # provincia_lower: provincia normalizada para filtrar por igualdad sin ILIKE
+    create_table_query = f"""
+    CREATE TABLE {table_name} (
         id SERIAL PRIMARY KEY,
         nombre VARCHAR(255) NOT NULL,
         direccion VARCHAR(500),
         localidad VARCHAR(255),
-        provincia VARCHAR(255)
+        provincia VARCHAR(255),
+        provincia_lower text GENERATED ALWAYS AS (lower(provincia)) STORED,
+        search_tsv tsvector GENERATED ALWAYS AS (
+            to_tsvector('spanish',
+                coalesce(nombre, '') || ' ' || coalesce(localidad, '') || ' ' || coalesce(provincia, ''))
+            || to_tsvector('simple',
+                coalesce(nombre, '') || ' ' || coalesce(localidad, '') || ' ' || coalesce(provincia, ''))
+        ) STORED
     );
     """
     cursor.execute(create_table_query)
-    print("✓ Tabla 'establecimientos' creada o verificada")
+    print(f"✓ Tabla '{table_name}' creada")
 
-def load_json_data(json_file='tu_archivo_grande.json'):
+def stream_rows(json_file='tu_archivo_grande.json'):
     """
-    Carga los datos desde el archivo JSON, extrayendo la lista de establecimientos.
+    Lee en streaming la lista de establecimientos del archivo JSON.
+    Genera tuplas (nombre, direccion, localidad, provincia) sin cargar el archivo en memoria,
+    descartando los establecimientos sin nombre.
     """
     print(f"📖 Leyendo datos desde {json_file}...")
+    # Columnas requeridas que aún no han aparecido en ningún establecimiento
+    missing_columns = set(REQUIRED_COLUMNS)
     try:
-        # 1. Cargar el JSON completo con la librería estándar
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        # 2. Seleccionar SOLAMENTE la lista de establecimientos
-        establecimientos_lista = data['establecimientos']
-
-        # 3. Crear el DataFrame a partir de esa lista específica
-        df = pd.DataFrame(establecimientos_lista)
-        
-        # Verificar que las columnas necesarias existen
-        required_columns = ['nombre', 'direccion', 'localidad', 'provincia']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            raise ValueError(f"Faltan las siguientes columnas en el JSON: {missing_columns}")
-        
-        # Limpiar datos: eliminar filas con nombre vacío y convertir NaN a None
-        df = df.dropna(subset=['nombre'])
-        df = df.fillna('')
-        
-        print(f"✓ Datos cargados: {len(df)} establecimientos encontrados")
-        return df
-
+        with open(json_file, 'rb') as f:
+            for obj in ijson.items(f, 'establecimientos.item'):
+                if missing_columns:
+                    missing_columns.difference_update(obj.keys())
+                
+                if obj.get('nombre'):
+                    yield (
+                        obj.get('nombre'),
+                        obj.get('direccion') or '',
+                        obj.get('localidad') or '',
+                        obj.get('provincia') or ''
+                    )
     except FileNotFoundError:
         print(f"❌ Error: El archivo {json_file} no se encontró.")
         raise
-    except KeyError:
-        print(f"❌ Error: La clave 'establecimientos' no se encontró en el archivo JSON.")
-        raise
+    
+    # Verificar que las columnas necesarias existen en el archivo; a los
+    # establecimientos a los que les falta alguna se les asigna ''
+    if missing_columns:
+        missing = [col for col in REQUIRED_COLUMNS if col in missing_columns]
+        raise ValueError(f"Faltan las siguientes columnas en el JSON: {missing}")
+
+class BinaryCopyStream:
+    """
+    Objeto tipo archivo que serializa filas al formato binario de COPY bajo demanda.
+    Permite pasar un generador de filas de texto a copy_expert sin materializarlo
+    en memoria y evita que PostgreSQL tenga que parsear CSV.
+    """
+    
+    # Firma, flags y longitud de la extensión de cabecera del formato binario
+    HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+    TRAILER = struct.pack('>h', -1)
+    
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = bytearray(self.HEADER)
+        self._finished = False
+    
+    @staticmethod
+    def _encode_row(row):
+        encoded = bytearray(struct.pack('>h', len(row)))
+        for value in row:
+            if value is None:
+                encoded += struct.pack('>i', -1)
+            else:
+                data = value.encode('utf-8')
+                encoded += struct.pack('>i', len(data))
+                encoded += data
+        return encoded
+    
+    def read(self, size=-1):
+        while not self._finished and (size < 0 or len(self._buffer) < size):
+            row = next(self._rows, None)
+            if row is None:
+                self._buffer += self.TRAILER
+                self._finished = True
+            else:
+                self._buffer += self._encode_row(row)
+        
+        if 0 <= size < len(self._buffer):
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        else:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        return data
 
-def insert_data(cursor, df):
-    """Inserta los datos en la base de datos"""
+def insert_data(cursor, table_name, json_file='tu_archivo_grande.json'):
+    """
+    Inserta los datos en la tabla indicada.
+    
+    Returns:
+        int: número de establecimientos insertados
+    """
     print("📝 Insertando datos en la base de datos...")
     
-    # Preparar datos para inserción
-    data_to_insert = []
-    for _, row in df.iterrows():
-        data_to_insert.append((
-            row['nombre'],
-            row['direccion'],
-            row['localidad'],
-            row['provincia']
-        ))
-    
-    # Insertar datos usando execute_values para mejor rendimiento
-    insert_query = """
-    INSERT INTO establecimientos (nombre, direccion, localidad, provincia)
-    VALUES %s
+    inserted = 0
+    
+    def counted(rows):
+        nonlocal inserted
+        for row in rows:
+            inserted += 1
+            yield row
+    
+    # COPY evita el parseo y la planificación por fila de los INSERT
+    copy_query = f"""
+    COPY {table_name} (nombre, direccion, localidad, provincia)
+    FROM STDIN WITH BINARY
     """
     
-    execute_values(
-        cursor,
-        insert_query,
-        data_to_insert,
-        template=None,
-        page_size=1000
-    )
+    cursor.copy_expert(copy_query, BinaryCopyStream(counted(stream_rows(json_file))))
     
-    print(f"✓ {len(data_to_insert)} establecimientos insertados")
+    # ijson no falla si falta la clave 'establecimientos' (o el JSON es una lista):
+    # simplemente no genera filas. Abortar antes del commit para no dejar la tabla vacía
+    if inserted == 0:
+        raise ValueError(
+            f"No se encontraron establecimientos en {json_file}: "
+            "se esperaba un objeto con la clave 'establecimientos' y al menos un elemento con nombre"
+        )
+    
+    print(f"✓ {inserted} establecimientos insertados")
+    return inserted
 
-def create_indexes(cursor):
+def create_indexes(cursor, table_name, suffix=''):
     """Crea índices para optimizar las búsquedas"""
     print("🔍 Creando índices para optimizar búsquedas...")
     
-    indexes = [
-        "CREATE INDEX IF NOT EXISTS idx_establecimientos_provincia ON establecimientos (provincia);",
-        "CREATE INDEX IF NOT EXISTS idx_establecimientos_nombre ON establecimientos (nombre);",
-        "CREATE INDEX IF NOT EXISTS idx_establecimientos_direccion ON establecimientos (direccion);",
-        "CREATE INDEX IF NOT EXISTS idx_establecimientos_nombre_ilike ON establecimientos USING gin (nombre gin_trgm_ops);",
-        "CREATE INDEX IF NOT EXISTS idx_establecimientos_direccion_ilike ON establecimientos USING gin (direccion gin_trgm_ops);"
-    ]
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
     
-    for index_query in indexes:
-        cursor.execute(index_query)
+    for index_name, index_definition in INDEXES.items():
+        cursor.execute(f"CREATE INDEX {index_name}{suffix} ON {table_name} {index_definition};")
     
     print("✓ Índices creados para optimizar búsquedas")
 
+def swap_tables(cursor):
+    """
+    Sustituye la tabla de la API por la tabla auxiliar ya cargada e indexada.
+    Solo este paso bloquea las consultas de la API, y dura lo que unos pocos renombrados.
+    """
+    # La vista depende de la tabla antigua; se recrea sobre la nueva a continuación
+    cursor.execute("DROP MATERIALIZED VIEW IF EXISTS provincias_mv;")
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE_NAME};")
+    
+    cursor.execute(f"ALTER TABLE {STAGING_TABLE_NAME} RENAME TO {TABLE_NAME};")
+    cursor.execute(f"ALTER SEQUENCE {STAGING_TABLE_NAME}_id_seq RENAME TO {TABLE_NAME}_id_seq;")
+    cursor.execute(f"ALTER TABLE {TABLE_NAME} RENAME CONSTRAINT {STAGING_TABLE_NAME}_pkey TO {TABLE_NAME}_pkey;")
+    for index_name in INDEXES:
+        cursor.execute(f"ALTER INDEX {index_name}_staging RENAME TO {index_name};")
+    
+    print(f"✓ Tabla '{STAGING_TABLE_NAME}' intercambiada por '{TABLE_NAME}'")
+
+def create_provincias_view(cursor):
+    """Crea la vista materializada con la lista de provincias que sirve /api/provincias"""
+    create_view_query = f"""
+    CREATE MATERIALIZED VIEW provincias_mv AS
+    SELECT DISTINCT provincia
+    FROM {TABLE_NAME}
+    WHERE provincia IS NOT NULL AND provincia <> ''
+    ORDER BY provincia;
+    """
+    cursor.execute(create_view_query)
+    print("✓ Vista materializada 'provincias_mv' creada")
+
+def invalidate_api_cache():
+    """Invalida la caché Redis de la API (si REDIS_URL está definida) incrementando su versión"""
+    redis_url = os.getenv('REDIS_URL')
+    if not redis_url:
+        return
+    
+    import redis
+    try:
+        redis.Redis.from_url(redis_url).incr("est:version")
+    except redis.RedisError as e:
+        # Los datos ya están confirmados: un fallo de Redis no debe marcar la carga como fallida
+        print(f"⚠️ No se pudo invalidar la caché de la API ({str(e)}); expirará por TTL o usa POST /refresh")
+        return
+    print("✓ Caché de la API invalidada")
+
 def main():
     """Función principal del script"""
     try:
@@ -130,27 +264,37 @@ def main():
         conn = psycopg2.connect(database_url)
         cursor = conn.cursor()
         
-        # Crear tabla
-        create_table_if_not_exists(cursor)
+        # Toda la carga (tabla, datos, índices y vista) va en una única transacción
+        configure_bulk_load_transaction(cursor)
         
-        # Cargar datos del JSON
-        df = load_json_data('tu_archivo_grande.json')
+        # La carga se prepara en una tabla auxiliar: la API sigue leyendo los
+        # datos anteriores (sin bloqueos) hasta el intercambio final
+        create_table(cursor, STAGING_TABLE_NAME)
         
-        # Limpiar datos existentes (opcional - comentar si quieres mantener datos previos)
-        cursor.execute("DELETE FROM establecimientos;")
-        print("✓ Datos existentes eliminados")
+        # Insertar datos leyendo el JSON en streaming
+        total = insert_data(cursor, STAGING_TABLE_NAME, 'tu_archivo_grande.json')
         
-        # Insertar datos
-        insert_data(cursor, df)
+        # Crear índices después del COPY para no mantenerlos fila a fila
+        create_indexes(cursor, STAGING_TABLE_NAME, suffix='_staging')
         
-        # Crear índices
-        create_indexes(cursor)
+        # Intercambiar tablas y recrear la lista de provincias precalculada
+        swap_tables(cursor)
+        create_provincias_view(cursor)
         
         # Confirmar cambios
         conn.commit()
         
+        # VACUUM no puede ejecutarse dentro de una transacción; actualiza el
+        # visibility map para que el índice de cobertura permita index-only scans
+        conn.autocommit = True
+        cursor.execute(f"VACUUM ANALYZE {TABLE_NAME};")
+        print("✓ Tabla analizada (VACUUM ANALYZE)")
+        
+        # Las respuestas cacheadas ya no reflejan los datos nuevos
+        invalidate_api_cache()
+        
         print("\n🎉 ¡Carga de datos completada exitosamente!")
-        print(f"📊 Total de establecimientos cargados: {len(df)}")
+        print(f"📊 Total de establecimientos cargados: {total}")
         print("🔍 Índices creados para búsquedas rápidas")
         
     except Exception as e:
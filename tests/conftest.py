@@ -0,0 +1,10 @@
+import os
+import sys
+
+# main.py exige DATABASE_URL al importarse; los tests no abren conexiones reales
+os.environ.setdefault('DATABASE_URL', 'postgresql://test@localhost/test')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# scripts/ no es un paquete: load_data se importa como módulo suelto
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
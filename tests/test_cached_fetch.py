@@ -0,0 +1,147 @@
+"""Tests de la caché con deduplicación de consultas de main.cached_fetch"""
+
+import asyncio
+
+import pytest
+
+import main
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self._pool = pool
+
+    async def fetch(self, query, *params):
+        self._pool.calls += 1
+        self._pool.started.set()
+        await self._pool.release.wait()
+        if self._pool.error is not None:
+            raise self._pool.error
+        return [(query, params)]
+
+
+class FakeAcquire:
+    def __init__(self, pool):
+        self._pool = pool
+
+    async def __aenter__(self):
+        return FakeConnection(self._pool)
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakePool:
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def acquire(self):
+        return FakeAcquire(self)
+
+
+@pytest.fixture(autouse=True)
+def clean_caches():
+    main._fetch_cache.clear()
+    main._fetch_inflight.clear()
+    yield
+    main._fetch_cache.clear()
+    main._fetch_inflight.clear()
+
+
+def run_with_pool(pool_factory, scenario):
+    async def runner():
+        pool = pool_factory()
+        main.app.state.pool = pool
+        return await scenario(pool)
+    return asyncio.run(runner())
+
+
+def test_concurrent_identical_queries_hit_database_once():
+    async def scenario(pool):
+        tasks = [asyncio.create_task(main.cached_fetch("SELECT 1", [1])) for _ in range(10)]
+        await pool.started.wait()
+        pool.release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert pool.calls == 1
+        assert all(result == results[0] for result in results)
+
+        # Dentro del TTL se sirve desde la caché
+        assert await main.cached_fetch("SELECT 1", [1]) == results[0]
+        assert pool.calls == 1
+        assert not main._fetch_inflight
+
+    run_with_pool(FakePool, scenario)
+
+
+def test_cache_version_is_part_of_the_key():
+    async def scenario(pool):
+        pool.release.set()
+        await main.cached_fetch("SELECT 1", [1], 1)
+        await main.cached_fetch("SELECT 1", [1], 2)
+
+        assert pool.calls == 2
+
+    run_with_pool(FakePool, scenario)
+
+
+def test_errors_propagate_to_all_waiters_and_are_not_cached():
+    async def scenario(pool):
+        tasks = [asyncio.create_task(main.cached_fetch("SELECT 1", [1])) for _ in range(3)]
+        await pool.started.wait()
+        pool.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert pool.calls == 1
+        assert all(isinstance(result, ValueError) for result in results)
+        assert not main._fetch_inflight
+
+        # Un error no se cachea: la siguiente petición vuelve a consultar
+        pool.error = None
+        assert await main.cached_fetch("SELECT 1", [1]) == [("SELECT 1", (1,))]
+        assert pool.calls == 2
+
+    run_with_pool(lambda: FakePool(error=ValueError("fallo")), scenario)
+
+
+def test_followers_retry_when_leader_is_cancelled():
+    async def scenario(pool):
+        leader = asyncio.create_task(main.cached_fetch("SELECT 1", [1]))
+        await pool.started.wait()
+        followers = [asyncio.create_task(main.cached_fetch("SELECT 1", [1])) for _ in range(3)]
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        # Los seguidores relanzan la consulta una sola vez en lugar de heredar la cancelación
+        pool.release.set()
+        results = await asyncio.gather(*followers)
+
+        assert all(result == [("SELECT 1", (1,))] for result in results)
+        assert pool.calls == 2
+        assert not main._fetch_inflight
+
+    run_with_pool(FakePool, scenario)
+
+
+def test_cancelled_follower_does_not_cancel_the_query():
+    async def scenario(pool):
+        leader = asyncio.create_task(main.cached_fetch("SELECT 1", [1]))
+        await pool.started.wait()
+        follower = asyncio.create_task(main.cached_fetch("SELECT 1", [1]))
+        await asyncio.sleep(0)
+
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+
+        pool.release.set()
+        assert await leader == [("SELECT 1", (1,))]
+        assert pool.calls == 1
+
+    run_with_pool(FakePool, scenario)
@@ -0,0 +1,51 @@
+"""Tests de la codificación de cursores de paginación de main"""
+
+import base64
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(orjson.dumps(value)).decode('ascii')
+
+
+@pytest.mark.parametrize("nombre, establecimiento_id", [
+    ("Estanco Nº 1 — Peñíscola", 1),
+    ("", 2**31 - 1),
+    ("a'b\"c/+=", 42),
+])
+def test_round_trip(nombre, establecimiento_id):
+    cursor = main.encode_cursor(nombre, establecimiento_id)
+
+    assert cursor.isascii()
+    assert main.decode_cursor(cursor) == (nombre, establecimiento_id)
+
+
+@pytest.mark.parametrize("cursor", [
+    "no es base64",
+    "ñ",
+    base64.urlsafe_b64encode(b"not json").decode('ascii'),
+    raw_cursor(None),
+    raw_cursor(7),
+    raw_cursor(["a"]),
+    raw_cursor(["a", 1, 2]),
+    raw_cursor([1, 1]),
+    raw_cursor(["a", "1"]),
+    raw_cursor(["a", 1.5]),
+    raw_cursor(["a", True]),
+    raw_cursor(["a", 0]),
+    raw_cursor(["a", -1]),
+    raw_cursor(["a", 2**31]),
+    raw_cursor(["a", 99999999999]),
+    raw_cursor(["a\x00b", 1]),
+    raw_cursor({"nombre": "a", "id": 1}),
+])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        main.decode_cursor(cursor)
+
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,66 @@
+"""Tests del endpoint /api/establecimientos de main"""
+
+import asyncio
+
+import pytest
+
+import main
+
+
+class ConcurrencyPool:
+    """Pool falso que solo responde cuando hay dos consultas en curso a la vez"""
+
+    def __init__(self, rows, total):
+        self.rows = rows
+        self.total = total
+        self.queries = []
+        self.both_running = asyncio.Event()
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+        return Acquire()
+
+    async def fetch(self, query, *params):
+        self.queries.append(query)
+        if len(self.queries) == 2:
+            self.both_running.set()
+        await asyncio.wait_for(self.both_running.wait(), timeout=1)
+        if query.startswith("SELECT COUNT(*)"):
+            return [(self.total,)]
+        return self.rows
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    main._fetch_cache.clear()
+    main._fetch_inflight.clear()
+    main.app.state.redis = None
+    yield
+    main._fetch_cache.clear()
+    main._fetch_inflight.clear()
+
+
+def test_first_page_fetches_page_and_total_concurrently():
+    rows = [
+        {"id": i, "nombre": f"Estanco {i}", "direccion": "", "localidad": "", "provincia": "Madrid"}
+        for i in range(1, 4)
+    ]
+
+    async def scenario():
+        main.app.state.pool = ConcurrencyPool(rows, total=40)
+        return await main.get_establecimientos(search=None, provincia="Madrid", cursor=None, limit=2)
+
+    response = asyncio.run(scenario())
+
+    assert response["establecimientos"] == rows[:2]
+    assert response["pagination"]["total"] == 40
+    assert response["pagination"]["has_more"] is True
+    assert main.decode_cursor(response["pagination"]["next_cursor"]) == ("Estanco 2", 2)
@@ -0,0 +1,106 @@
+"""Tests de la lectura y serialización al formato binario de COPY de scripts/load_data.py"""
+
+import json
+import struct
+
+import pytest
+
+import load_data
+
+
+def write_json(tmp_path, establecimientos):
+    path = tmp_path / "establecimientos.json"
+    path.write_text(json.dumps({"establecimientos": establecimientos}), encoding="utf-8")
+    return str(path)
+
+
+def decode_copy_binary(data):
+    """Decodificador mínimo del formato binario de COPY, independiente del de load_data"""
+    signature = b'PGCOPY\n\xff\r\n\x00'
+    assert data.startswith(signature)
+    flags, extension_length = struct.unpack_from('>ii', data, len(signature))
+    assert (flags, extension_length) == (0, 0)
+    offset = len(signature) + 8
+
+    rows = []
+    while True:
+        (field_count,) = struct.unpack_from('>h', data, offset)
+        offset += 2
+        if field_count == -1:
+            assert offset == len(data), "datos después del trailer"
+            return rows
+        row = []
+        for _ in range(field_count):
+            (length,) = struct.unpack_from('>i', data, offset)
+            offset += 4
+            if length == -1:
+                row.append(None)
+            else:
+                row.append(data[offset:offset + length].decode('utf-8'))
+                offset += length
+        rows.append(tuple(row))
+
+
+ROWS = [
+    ("Estanco Nº 1", "C/ Peñíscola 3", "A Coruña", "A Coruña"),
+    ("Expendeduría 😀", None, "", "Ávila"),
+]
+
+
+def test_stream_rows_fills_keys_missing_from_some_objects(tmp_path):
+    json_file = write_json(tmp_path, [
+        {"nombre": "Estanco 1", "direccion": "C/ Mayor 1", "localidad": "Sol", "provincia": "Madrid"},
+        {"nombre": "Estanco 2", "localidad": None, "provincia": "Madrid"},
+        {"nombre": "", "direccion": "", "localidad": "", "provincia": ""},
+    ])
+
+    assert list(load_data.stream_rows(json_file)) == [
+        ("Estanco 1", "C/ Mayor 1", "Sol", "Madrid"),
+        ("Estanco 2", "", "", "Madrid"),
+    ]
+
+
+def test_stream_rows_rejects_a_key_missing_from_the_whole_file(tmp_path):
+    json_file = write_json(tmp_path, [
+        {"nombre": "Estanco 1", "localidad": "Sol", "provincia": "Madrid"},
+        {"nombre": "Estanco 2", "localidad": "Sol", "provincia": "Madrid"},
+    ])
+
+    with pytest.raises(ValueError, match="direccion"):
+        list(load_data.stream_rows(json_file))
+
+
+def test_binary_copy_stream_header_and_trailer():
+    data = load_data.BinaryCopyStream([]).read()
+
+    assert data == b'PGCOPY\n\xff\r\n\x00' + b'\x00' * 8 + b'\xff\xff'
+
+
+def test_binary_copy_stream_encodes_nulls_and_multibyte_text():
+    data = load_data.BinaryCopyStream(ROWS).read()
+
+    assert decode_copy_binary(data) == ROWS
+    # Las longitudes son de bytes UTF-8, no de caracteres
+    encoded = "Expendeduría 😀".encode('utf-8')
+    assert struct.pack('>i', len(encoded)) + encoded in data
+    # NULL es una longitud -1 sin datos
+    assert struct.pack('>i', -1) in data
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64, 8192])
+def test_binary_copy_stream_chunked_reads(size):
+    stream = load_data.BinaryCopyStream(iter(ROWS * 50))
+
+    chunks = []
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        assert len(chunk) <= size
+        chunks.append(chunk)
+
+    assert b''.join(chunks) == load_data.BinaryCopyStream(ROWS * 50).read()
+    assert decode_copy_binary(b''.join(chunks)) == ROWS * 50
+    # Una vez agotado sigue devolviendo b''
+    assert stream.read(size) == b''
+    assert stream.read() == b''
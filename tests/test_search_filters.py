@@ -0,0 +1,97 @@
+"""Tests de la normalización de filtros y del SQL de búsqueda de main"""
+
+import re
+
+import main
+
+
+def test_single_word_is_an_unstemmed_prefix():
+    search_mode, provincia_mode, params = main._search_filters("madri", None)
+
+    assert search_mode == 'prefix'
+    assert provincia_mode is None
+    assert params == ["madri:*"]
+
+
+def test_complete_words_use_spanish_and_last_word_is_a_prefix():
+    search_mode, _, params = main._search_filters("  estanco alicant ", None)
+
+    assert search_mode == 'fulltext'
+    assert params == ["estanco", "alicant:*"]
+
+
+def test_stopwords_are_searchable_while_typing():
+    # "las" es stopword en español: como prefijo va contra los lexemas simple,
+    # y como palabra completa to_tsquery('spanish') la descarta y && la ignora
+    assert main._search_filters("las", None) == ('prefix', None, ["las:*"])
+    assert main._search_filters("las palm", None) == ('fulltext', None, ["las", "palm:*"])
+
+
+def test_punctuation_is_not_passed_to_to_tsquery():
+    search_mode, _, params = main._search_filters("c/ mayor & sol:", None)
+
+    assert search_mode == 'fulltext'
+    assert params == ["c & mayor", "sol:*"]
+
+
+def test_short_terms_use_ilike_on_every_column():
+    search_mode, _, params = main._search_filters("ab", None)
+
+    assert search_mode == 'ilike'
+    assert params == ["%ab%"]
+
+
+def test_term_without_word_characters_uses_ilike():
+    search_mode, _, params = main._search_filters("%%%", None)
+
+    assert search_mode == 'ilike'
+    assert params == ["%%%%%"]
+
+
+def test_provincia_modes():
+    assert main._search_filters(None, " Madrid ") == (None, 'exact', ["Madrid"])
+    assert main._search_filters(None, "Las %") == (None, 'ilike', ["Las %"])
+    assert main._search_filters(None, "  ") == (None, None, [])
+
+
+def test_prefix_query_matches_simple_lexemes():
+    query, params = main.build_search_query("madri", None, None, 25)
+
+    assert "search_tsv @@ to_tsquery('simple', $1)" in query
+    assert "spanish" not in query
+    assert query.endswith("LIMIT $2")
+    assert params == ["madri:*", 26]
+
+
+def test_fulltext_query_combines_spanish_and_simple_tsqueries():
+    query, params = main.build_search_query("estanco alicant", "Alicante", ("Bar", 7), 10)
+
+    assert (
+        "search_tsv @@ (to_tsquery('spanish', $1) && to_tsquery('simple', $2))" in query
+    )
+    assert "provincia_lower = LOWER($3)" in query
+    assert "(nombre, id) > ($4, $5)" in query
+    assert query.endswith("LIMIT $6")
+    assert params == ["estanco", "alicant:*", "Alicante", "Bar", 7, 11]
+
+
+def test_count_query_shares_the_search_conditions():
+    query, params = main.build_count_query("estanco alicant", None)
+
+    assert query == (
+        "SELECT COUNT(*) FROM establecimientos WHERE "
+        "search_tsv @@ (to_tsquery('spanish', $1) && to_tsquery('simple', $2))"
+    )
+    assert params == ["estanco", "alicant:*"]
+
+
+def test_every_query_shape_numbers_its_parameters_consecutively():
+    for (search_mode, provincia_mode, has_cursor), query in main._SEARCH_QUERIES.items():
+        expected = (
+            {None: 0, 'prefix': 1, 'ilike': 1, 'fulltext': 2}[search_mode]
+            + (provincia_mode is not None)
+            + 2 * has_cursor
+            + 1
+        )
+        placeholders = {int(n) for n in re.findall(r'\$(\d+)', query)}
+        assert placeholders == set(range(1, expected + 1)), query